@@ -0,0 +1,17 @@
+import os
+import uvicorn
+
+if __name__ == "__main__":
+    # Single source of the server settings, also used by the docker image:
+    # uvloop + httptools, 2 * cores + 1 workers unless WEB_CONCURRENCY is set
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # Worker processes read this to split the FMCSA concurrency cap between them
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    )
@@ -1,24 +1,79 @@
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, Field
+from typing import List, NamedTuple, Optional
+import asyncio
 import httpx
+import orjson
 import os
-import csv
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
-app = FastAPI()
+FMCSA_BASE_URL = "https://mobile.fmcsa.dot.gov"
+FMCSA_API_KEY = os.getenv("FMCSA_API_KEY")
+
+# Carrier validation messages
+CARRIER_AUTHORIZED_MESSAGE = "Carrier is authorized to operate"
+CARRIER_UNAUTHORIZED_MESSAGE = "Carrier is not authorized to operate"
+
+# Maximum number of FMCSA requests in flight at once across all workers; each
+# worker process gets an equal share (WEB_CONCURRENCY is exported by api.py)
+FMCSA_MAX_CONCURRENCY = 50
+FMCSA_WORKER_CONCURRENCY = max(1, FMCSA_MAX_CONCURRENCY // int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Maximum number of MC numbers accepted by the batch endpoint
+CARRIER_BATCH_MAX_SIZE = 100
+
+# Carrier validations keyed by cleaned MC number; FMCSA records change slowly.
+# The cache is per worker process, so each worker warms its own copy
+carrier_cache = TTLCache(maxsize=10_000, ttl=3600)
+
+# In-flight FMCSA lookups (CarrierLookup) keyed by cleaned MC number, so
+# concurrent cache misses for the same carrier share one upstream call
+carrier_lookups = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load the CSV into memory and open a shared FMCSA client when the app starts.
+    The client is reused across requests so connections are kept alive, and
+    HTTP/2 lets concurrent validations share a single connection.
+    """
+    if not FMCSA_API_KEY:
+        raise RuntimeError("FMCSA API key not configured")
+    load_data()
+    app.state.http = httpx.AsyncClient(
+        base_url=FMCSA_BASE_URL,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        http2=True
+    )
+    app.state.fmcsa_semaphore = asyncio.Semaphore(FMCSA_WORKER_CONCURRENCY)
+    yield
+    await app.state.http.aclose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 class CarrierRequest(BaseModel):
     mc_number: str
 
+class CarrierBatchRequest(BaseModel):
+    mc_numbers: List[str] = Field(..., min_length=1, max_length=CARRIER_BATCH_MAX_SIZE)
+
 class CarrierValidation(BaseModel):
     mc_number: str
-    legal_name: Optional[str]
-    dba_name: Optional[str]
+    legal_name: Optional[str] = None
+    dba_name: Optional[str] = None
     is_valid: bool
     message: str
-    safety_rating: Optional[str]
-    location: Optional[dict]
-    status: Optional[dict]
+    safety_rating: Optional[str] = None
+    location: Optional[dict] = None
+    status: Optional[dict] = None
 
 class ReferenceNumberRequest(BaseModel):
     reference_number: str
@@ -34,59 +89,168 @@ class ReferenceNumberDetails(BaseModel):
 class ErrorResponse(BaseModel):
     detail: str
 
+@dataclass
+class CarrierLookup:
+    """An FMCSA lookup in flight and the number of callers awaiting it."""
+    task: asyncio.Future
+    waiters: int = 0
+
+# Column schema of loads.csv
+class LoadRow(NamedTuple):
+    reference_number: str
+    origin: str
+    destination: str
+    equipment_type: str
+    rate: str
+    commodity: str
+
 
-# Global dictionary to store loads
-loads_dict = {}
+# Pre-serialized JSON body for each load, keyed by reference number
+loads_json = {}
 
 def load_csv():
     """
-    Load the CSV file into a DataFrame.
+    Load the CSV file into a dictionary keyed by reference number.
     """
-    try:
-        loads = {}
-        with open("app/loads.csv", "r") as file:
-            # Skip header
-            headers = file.readline().strip().split(',')
-            
-            # Read data
-            for line in file:
-                line_csv = csv.reader([line])
-                values = next(line_csv)
-                ref_num = values[0]  # reference_number is first column
-                loads[ref_num] = {
-                    "reference_number": values[0],
-                    "origin": values[1],
-                    "destination": values[2],
-                    "equipment_type": values[3],
-                    "rate": values[4],
-                    "commodity": values[5]
-                }
-        return loads
-    except Exception as e:
-        print(f"Error loading CSV: {e}")
-        return {}
-
-def get_loads():
-    try:
-        return pd.read_csv('loads.csv')
-    except Exception as e:
-        print(f"Error loading CSV: {e}")
-        return pd.DataFrame()
+    # Parse with pyarrow's multithreaded reader, keeping every column as a string
+    with pa.memory_map("app/loads.csv") as source:
+        table = pacsv.read_csv(
+            source,
+            convert_options=pacsv.ConvertOptions(
+                column_types={field: pa.string() for field in LoadRow._fields}
+            )
+        )
+    columns = [table.column(field).to_pylist() for field in LoadRow._fields]
+    return {row[0]: LoadRow(*row) for row in zip(*columns)}
 
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
-@app.on_event("startup")
 def load_data():
     """
     Load the CSV into memory when the app starts.
     """
-    global loads_dict
-    loads_dict = load_csv()
-    if not loads_dict:
-        print("Warning: Load data is empty. Check 'loads.csv'")
+    global loads_json
+    try:
+        loads = load_csv()
+    except Exception as e:
+        raise RuntimeError(f"Error loading CSV 'app/loads.csv': {e}") from e
+    loads_json = {ref: orjson.dumps(load._asdict()) for ref, load in loads.items()}
+    if not loads_json:
+        raise RuntimeError("Load data is empty. Check 'app/loads.csv'")
+
+def clean_mc_number(mc_number: str) -> str:
+    """
+    Strip the optional 'MC' prefix and validate the MC number format.
+    """
+    # Clean MC number (remove leading 'MC' prefix if present)
+    mc_number = mc_number.strip().upper().removeprefix("MC").lstrip()
+
+    # Validate MC number format (ASCII digits only)
+    if not (mc_number.isascii() and mc_number.isdecimal()):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid MC number format"
+        )
+    return mc_number
+
+async def check_carrier(mc_number: str) -> CarrierValidation:
+    """
+    Look a cleaned MC number up in FMCSA, using the cache when possible.
+    Shared by the single and batch validation endpoints.
+    """
+    # Return cached validation if this carrier was checked recently
+    cached = carrier_cache.get(mc_number)
+    if cached is not None:
+        return cached
+
+    # Join a lookup already in flight for this carrier, or start one
+    lookup = carrier_lookups.get(mc_number)
+    if lookup is None:
+        lookup = CarrierLookup(task=asyncio.ensure_future(fetch_carrier(mc_number)))
+        carrier_lookups[mc_number] = lookup
+
+        def forget_lookup(_):
+            if carrier_lookups.get(mc_number) is lookup:
+                del carrier_lookups[mc_number]
+
+        lookup.task.add_done_callback(forget_lookup)
+
+    lookup.waiters += 1
+    try:
+        # Shield so one cancelled caller doesn't cancel the lookup for the others
+        return await asyncio.shield(lookup.task)
+    finally:
+        lookup.waiters -= 1
+        if lookup.waiters == 0 and not lookup.task.done():
+            # Last caller gave up; stop the upstream call
+            lookup.task.cancel()
+            carrier_lookups.pop(mc_number, None)
+
+async def fetch_carrier(mc_number: str) -> CarrierValidation:
+    """
+    Look a cleaned MC number up in FMCSA and cache the result.
+    """
+    try:
+        client = app.state.http
+        async with app.state.fmcsa_semaphore:
+            response = await client.get(
+                f"/qc/services/carriers/docket-number/{mc_number}",
+                params={"webKey": FMCSA_API_KEY}
+            )
+        
+        if response.status_code == 404:
+            carrier = CarrierValidation(
+                mc_number=mc_number,
+                is_valid=False,
+                message="Carrier not found",
+            )
+            carrier_cache[mc_number] = carrier
+            return carrier
+            
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"FMCSA API error: {response.text}"
+            )
+
+        # Parse FMCSA response; docket lookups are a few KB, where a full orjson
+        # parse is faster than stream-parsing only content[0].carrier
+        data = orjson.loads(response.content)
+        carrier_data = data.get("content", [])
+        carrier_data = carrier_data[0].get("carrier", {})
+        
+        # Check if carrier is valid
+        is_valid = carrier_data.get("allowedToOperate") in ("Y", "y")
+        
+        # Create response
+        carrier = CarrierValidation(
+            mc_number=f"MC{mc_number}",
+            legal_name=carrier_data.get("legalName"),
+            dba_name=carrier_data.get("dbaName"),
+            is_valid=is_valid,
+            safety_rating=carrier_data.get("safetyRating"),
+            location = {
+                    "state": carrier_data.get("phyState")
+                },
+            status= {
+                    "code": carrier_data.get("statusCode"),
+                    "safety_rating_date": carrier_data.get("safetyRatingDate")
+                },
+            message=CARRIER_AUTHORIZED_MESSAGE if is_valid else CARRIER_UNAUTHORIZED_MESSAGE
+        )
+        carrier_cache[mc_number] = carrier
+        return carrier
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error validating carrier: {str(e)}"
+        )
 
 @app.get(
     "/carriers/validate",
@@ -110,84 +274,60 @@ async def validate_carrier(mc_number: str):
     - 400: Invalid MC number or validation failed
     - 500: Server error or FMCSA API error
     """
-    # Get API key from environment
-    fmcsa_api_key = os.getenv("FMCSA_API_KEY")
-    if not fmcsa_api_key:
-        raise HTTPException(
-            status_code=500,
-            detail="FMCSA API key not configured"
-        )
+    return await check_carrier(clean_mc_number(mc_number))
 
-    # Clean MC number (remove 'MC' prefix if present)
-    mc_number = mc_number.upper().replace('MC', '').strip()
+
+@app.post(
+    "/carriers/validate/batch",
+    response_model=List[CarrierValidation],
+    responses={
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse}
+    }
+)
+async def validate_carrier_batch(request: CarrierBatchRequest):
+    """
+    Validate several carriers at once using FMCSA API
     
-    # Validate MC number format
-    if not mc_number.isdigit():
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid MC number format"
-        )
+    Parameters:
+    - mc_numbers: List of Motor Carrier numbers (each can include 'MC' prefix)
+    
+    Returns:
+    - Carrier validation details for each MC number, in request order
+    
+    Raises:
+    - 400: Invalid MC number or validation failed
+    - 500: Server error or FMCSA API error
+    """
+    # Validate every MC number before any upstream call is made
+    mc_numbers = [clean_mc_number(mc_number) for mc_number in request.mc_numbers]
 
+    # Look up each distinct carrier once; stop the rest as soon as one fails
+    tasks = {
+        mc_number: asyncio.ensure_future(check_carrier(mc_number))
+        for mc_number in dict.fromkeys(mc_numbers)
+    }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://mobile.fmcsa.dot.gov/qc/services/carriers/docket-number/{mc_number}",
-                params={"webKey": fmcsa_api_key}
-            )
-            
-            if response.status_code == 404:
-                return CarrierValidation(
-                    mc_number=mc_number,
-                    is_valid=False,
-                    message="Carrier not found",
-                )
-                
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"FMCSA API error: {response.text}"
-                )
-
-            # Parse FMCSA response
-            data = response.json()
-            carrier_data = data.get("content", [])
-            carrier_data = carrier_data[0].get("carrier", {})
-            
-            # Check if carrier is valid
-            is_valid = carrier_data.get("allowedToOperate", "").upper() == "Y"
-            
-            # Create response
-            return CarrierValidation(
-                mc_number=f"MC{mc_number}",
-                legal_name=carrier_data.get("legalName"),
-                dba_name=carrier_data.get("dbaName"),
-                is_valid=is_valid,
-                safety_rating=carrier_data.get("safetyRating"),
-                location = {
-                        "state": carrier_data.get("phyState")
-                    },
-                status= {
-                        "code": carrier_data.get("statusCode"),
-                        "safety_rating_date": carrier_data.get("safetyRatingDate")
-                    },
-                message="Carrier is authorized to operate" if is_valid else "Carrier is not authorized to operate"
-            )
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error validating carrier: {str(e)}"
-        )
+        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    for task in tasks.values():
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
 
+    return [tasks[mc_number].result() for mc_number in mc_numbers]
 
-@app.get("/items", response_model=ReferenceNumberDetails,
+
+@app.get("/items",
         responses={
+        200: {"model": ReferenceNumberDetails},
         404: {"model": ErrorResponse},
         500: {"model": ErrorResponse}
     })
-def read_item(reference_number: str):
+async def read_item(reference_number: str):
     """
     Validate reference number using csv
     
@@ -202,29 +342,16 @@ def read_item(reference_number: str):
     - 500: Server error
     """
     try:
-        # Check if dictionary is empty
-        if not loads_dict:
-            raise HTTPException(
-                status_code=500,
-                detail="No load data available"
-            )
-
         # Try to get the load
-        load = loads_dict.get(reference_number)
-        if not load:
+        load = loads_json.get(reference_number)
+        if load is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"Load not found: {reference_number}"
             )
 
-        return ReferenceNumberDetails(
-            reference_number=load["reference_number"],
-            origin=load["origin"],
-            destination=load["destination"],
-            equipment_type=load["equipment_type"],
-            rate=load["rate"],
-            commodity=load["commodity"]
-        )
+        # Body was serialized at startup, so send the bytes as-is
+        return Response(content=load, media_type="application/json")
 
     except HTTPException:
         raise
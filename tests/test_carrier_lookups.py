@@ -0,0 +1,188 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app import main
+
+
+class FakeFMCSA:
+    """Mock FMCSA transport that holds every request until release() is called."""
+
+    def __init__(self, failing=()):
+        self.calls = []
+        self.cancelled = []
+        self.failing = set(failing)
+        self.gate = asyncio.Event()
+
+    def release(self):
+        self.gate.set()
+
+    async def handler(self, request):
+        mc_number = request.url.path.rsplit("/", 1)[-1]
+        self.calls.append(mc_number)
+        try:
+            if mc_number not in self.failing:
+                await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(mc_number)
+            raise
+        if mc_number in self.failing:
+            return httpx.Response(503, text="unavailable")
+        return httpx.Response(200, json={
+            "content": [{"carrier": {"allowedToOperate": "Y", "legalName": f"Carrier {mc_number}"}}]
+        })
+
+
+@pytest.fixture(autouse=True)
+def clear_carrier_state():
+    main.carrier_cache.clear()
+    main.carrier_lookups.clear()
+    yield
+    main.carrier_cache.clear()
+    main.carrier_lookups.clear()
+
+
+def run_with_fmcsa(test, failing=()):
+    """Run an async test body against a fresh FakeFMCSA and shared client."""
+    async def runner():
+        fmcsa = FakeFMCSA(failing)
+        main.app.state.http = httpx.AsyncClient(
+            base_url="http://fmcsa.test", transport=httpx.MockTransport(fmcsa.handler)
+        )
+        main.app.state.fmcsa_semaphore = asyncio.Semaphore(main.FMCSA_WORKER_CONCURRENCY)
+        try:
+            # Fail instead of hanging if a lookup is never released or cancelled
+            await asyncio.wait_for(test(fmcsa), timeout=5)
+        finally:
+            await main.app.state.http.aclose()
+    asyncio.run(runner())
+
+
+async def settle():
+    # Let started tasks reach the mock transport
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_misses_share_one_upstream_call():
+    async def test(fmcsa):
+        waiters = [asyncio.ensure_future(main.check_carrier("77")) for _ in range(5)]
+        await settle()
+        fmcsa.release()
+        results = await asyncio.gather(*waiters)
+
+        assert fmcsa.calls == ["77"]
+        assert all(result is results[0] for result in results)
+        assert main.carrier_cache["77"] is results[0]
+        assert main.carrier_lookups == {}
+
+    run_with_fmcsa(test)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_lookup():
+    async def test(fmcsa):
+        first = asyncio.ensure_future(main.check_carrier("77"))
+        second = asyncio.ensure_future(main.check_carrier("77"))
+        await settle()
+        first.cancel()
+        await settle()
+        fmcsa.release()
+
+        result = await second
+        assert first.cancelled()
+        assert result.legal_name == "Carrier 77"
+        assert fmcsa.calls == ["77"]
+        assert fmcsa.cancelled == []
+        assert main.carrier_cache["77"] is result
+
+    run_with_fmcsa(test)
+
+
+def test_cancelling_last_waiter_cancels_upstream_call():
+    async def test(fmcsa):
+        waiter = asyncio.ensure_future(main.check_carrier("77"))
+        await settle()
+        waiter.cancel()
+        await settle()
+
+        assert waiter.cancelled()
+        assert fmcsa.cancelled == ["77"]
+        assert "77" not in main.carrier_cache
+        assert main.carrier_lookups == {}
+
+    run_with_fmcsa(test)
+
+
+def test_request_after_cancel_starts_a_new_lookup():
+    async def test(fmcsa):
+        waiter = asyncio.ensure_future(main.check_carrier("77"))
+        await settle()
+        waiter.cancel()
+        retry = asyncio.ensure_future(main.check_carrier("77"))
+        await settle()
+        fmcsa.release()
+
+        result = await retry
+        assert result.legal_name == "Carrier 77"
+        assert fmcsa.calls == ["77", "77"]
+        assert main.carrier_lookups == {}
+
+    run_with_fmcsa(test)
+
+
+def test_batch_failure_cancels_remaining_lookups():
+    async def test(fmcsa):
+        request = main.CarrierBatchRequest(mc_numbers=["1", "9", "2", "3"])
+        with pytest.raises(HTTPException) as error:
+            await main.validate_carrier_batch(request)
+
+        assert error.value.status_code == 500
+        assert sorted(fmcsa.cancelled) == ["1", "2", "3"]
+        assert len(main.carrier_cache) == 0
+        assert main.carrier_lookups == {}
+
+    run_with_fmcsa(test, failing={"9"})
+
+
+def test_cancelled_batch_cancels_its_lookups():
+    async def test(fmcsa):
+        request = main.CarrierBatchRequest(mc_numbers=["1", "2"])
+        batch = asyncio.ensure_future(main.validate_carrier_batch(request))
+        await settle()
+        batch.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await batch
+
+        assert sorted(fmcsa.cancelled) == ["1", "2"]
+        assert len(main.carrier_cache) == 0
+        assert main.carrier_lookups == {}
+
+    run_with_fmcsa(test)
+
+
+def test_batch_dedupes_and_keeps_request_order():
+    async def test(fmcsa):
+        request = main.CarrierBatchRequest(mc_numbers=["55"] * 3 + ["MC56", "55"])
+        batch = asyncio.ensure_future(main.validate_carrier_batch(request))
+        await settle()
+        fmcsa.release()
+        results = await batch
+
+        assert sorted(fmcsa.calls) == ["55", "56"]
+        assert [result.mc_number for result in results] == ["MC55"] * 3 + ["MC56", "MC55"]
+
+    run_with_fmcsa(test)
+
+
+def test_invalid_batch_entry_is_rejected_before_any_lookup():
+    async def test(fmcsa):
+        request = main.CarrierBatchRequest(mc_numbers=["4", "x"])
+        with pytest.raises(HTTPException) as error:
+            await main.validate_carrier_batch(request)
+
+        assert error.value.status_code == 400
+        assert fmcsa.calls == []
+
+    run_with_fmcsa(test)